@@ -1,5 +1,6 @@
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 from pydantic import BaseModel, Field
 from typing import List, Dict, Optional
 import torch
@@ -7,11 +8,22 @@ import torch.nn as nn
 import numpy as np
 import pickle
 from rdkit import Chem
-from rdkit.Chem import AllChem, Descriptors
+from rdkit.Chem import Descriptors, rdFingerprintGenerator
 import uvicorn
 import google.generativeai as genai
 from dotenv import load_dotenv
 import os
+import io
+import asyncio
+import contextlib
+import functools
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import onnxruntime as ort
+except ImportError:
+    ort = None
 
 # Load environment variables
 load_dotenv()
@@ -47,7 +59,10 @@ class TransformerRegressor(nn.Module):
         )
         
     def forward(self, x):
-        x = self.input_projection(x)
+        return self.encode(self.input_projection(x))
+    
+    def encode(self, x):
+        """Everything after input_projection, so the projection can be computed sparsely"""
         x = x.unsqueeze(1)
         x = x + self.pos_embedding
         x = self.transformer_encoder(x)
@@ -55,6 +70,87 @@ class TransformerRegressor(nn.Module):
         output = self.output_head(x)
         return output
 
+class FastEncoderBlock(nn.Module):
+    """Post-norm encoder layer specialised for a single token.
+    
+    With seq_len=1 the attention softmax is exactly 1, so self-attention
+    reduces to out_proj(v_proj(x)), which is folded into one Linear.
+    """
+    def __init__(self, d_model=256, dim_feedforward=1024, layer_norm_eps=1e-5):
+        super(FastEncoderBlock, self).__init__()
+        
+        self.attention = nn.Linear(d_model, d_model)
+        self.linear1 = nn.Linear(d_model, dim_feedforward)
+        self.linear2 = nn.Linear(dim_feedforward, d_model)
+        self.norm1 = nn.LayerNorm(d_model, eps=layer_norm_eps)
+        self.norm2 = nn.LayerNorm(d_model, eps=layer_norm_eps)
+    
+    @classmethod
+    def from_encoder_layer(cls, layer: nn.TransformerEncoderLayer) -> 'FastEncoderBlock':
+        """Build a block from a trained (post-norm, ReLU) TransformerEncoderLayer"""
+        d_model = layer.linear1.in_features
+        block = cls(d_model, layer.linear1.out_features, layer.norm1.eps)
+        block = block.to(layer.linear1.weight.device)
+        
+        attn = layer.self_attn
+        w_v = attn.in_proj_weight[2 * d_model:]
+        b_v = attn.in_proj_bias[2 * d_model:]
+        
+        with torch.no_grad():
+            block.attention.weight.copy_(attn.out_proj.weight @ w_v)
+            block.attention.bias.copy_(attn.out_proj.weight @ b_v + attn.out_proj.bias)
+        block.linear1.load_state_dict(layer.linear1.state_dict())
+        block.linear2.load_state_dict(layer.linear2.state_dict())
+        block.norm1.load_state_dict(layer.norm1.state_dict())
+        block.norm2.load_state_dict(layer.norm2.state_dict())
+        return block.eval()
+    
+    def forward(self, x):
+        x = self.norm1(x + self.attention(x))
+        x = self.norm2(x + self.linear2(torch.relu(self.linear1(x))))
+        return x
+
+class FP32Linear(nn.Linear):
+    """Linear layer that always runs in FP32, even under autocast"""
+    def forward(self, x):
+        with torch.autocast(device_type=x.device.type, enabled=False):
+            return nn.functional.linear(x.float(), self.weight, self.bias)
+
+def to_fp32_linear(layer: nn.Linear) -> FP32Linear:
+    """Copy a Linear layer into an FP32Linear"""
+    fp32_layer = FP32Linear(layer.in_features, layer.out_features, device=layer.weight.device)
+    fp32_layer.load_state_dict(layer.state_dict())
+    return fp32_layer
+
+def scaler_vectors(scaler) -> tuple:
+    """Extract float32 (mean, scale) vectors from a fitted StandardScaler"""
+    n_features = scaler.n_features_in_
+    mean = scaler.mean_ if scaler.mean_ is not None else np.zeros(n_features)
+    scale = scaler.scale_ if scaler.scale_ is not None else np.ones(n_features)
+    return mean.astype(np.float32), scale.astype(np.float32)
+
+def fuse_scalers(model: TransformerRegressor):
+    """Fold the X scaling into input_projection and the y scaling into the last output Linear"""
+    proj = model.input_projection
+    head = model.output_head[-1]
+    
+    x_mean, x_scale, y_mean, y_scale = (
+        torch.from_numpy(v).to(device) for v in (X_mean, X_scale, Y_mean, Y_scale)
+    )
+    
+    with torch.no_grad():
+        # W((x - mean) / scale) + b  ->  (W / scale)x + (b - (W / scale)mean)
+        proj.weight.div_(x_scale)
+        proj.bias.sub_(proj.weight @ x_mean)
+        
+        # (Wx + b) * scale + mean  ->  (scale * W)x + (b * scale + mean)
+        head.weight.mul_(y_scale.unsqueeze(1))
+        head.bias.mul_(y_scale).add_(y_mean)
+    
+    # The fused layers carry unscaled magnitudes, so keep them out of reduced precision
+    model.input_projection = to_fp32_linear(proj)
+    model.output_head[-1] = to_fp32_linear(head)
+
 # -----------------------------
 # FastAPI App Setup
 # -----------------------------
@@ -76,17 +172,45 @@ app.add_middleware(
 # Global Variables
 # -----------------------------
 model = None
-scaler_X = None
-scaler_y = None
+eager_model = None
+onnx_session = None
+cuda_graphs = {}
+pad_batches = False
+X_mean = None
+X_scale = None
+Y_mean = None
+Y_scale = None
 config = None
+confidence_bounds = None
+property_labels = None
+chat_context_prefix = None
 device = None
+autocast_dtype = None
 gemini_model = None
+request_queue = None
+inference_executor = None
+sparse_input = False
+projection_weight_t = None
+host_buffer = None
+device_bits = None
+bit_shifts = None
+device_buffer = None
+batch_task = None
+
+# Dynamic batching limits for /predict
+MAX_BATCH_SIZE = int(os.getenv('MAX_BATCH_SIZE', '32'))
+MAX_BATCH_DELAY = float(os.getenv('MAX_BATCH_DELAY_MS', '10')) / 1000
+
+# Batch sizes the compiled model and CUDA graphs are warmed for (powers of two up to
+# MAX_BATCH_SIZE); batches are padded up to the next one so no shape is seen cold
+BATCH_BUCKETS = sorted({min(2 ** i, MAX_BATCH_SIZE) for i in range(MAX_BATCH_SIZE.bit_length() + 1)})
 
 # -----------------------------
 # Pydantic Models
 # -----------------------------
 class MoleculeInput(BaseModel):
     smiles: str = Field(..., description="SMILES string of the molecule")
+    include_info: bool = Field(default=True, description="Include formula, weight and ring/bond counts")
     
     class Config:
         json_schema_extra = {
@@ -138,6 +262,38 @@ class ChatResponse(BaseModel):
 # -----------------------------
 # Helper Functions
 # -----------------------------
+# Morgan fingerprint generator (radius 2, 2048 bits), built once and reused
+MORGAN_GENERATOR = rdFingerprintGenerator.GetMorganGenerator(radius=2, fpSize=2048)
+
+# Typical QM9 value ranges used by calculate_confidence
+CONFIDENCE_BOUNDS = {
+    'mu': (0, 10),
+    'alpha': (10, 300),
+    'homo': (-15, 5),
+    'lumo': (-15, 5),
+    'gap': (0, 20)
+}
+
+# Max mixed precision drift (RMSE in target std units) accepted for GPU autocast. The
+# checkpoint's own validation RMSE is ~0.7 std and independent errors add in quadrature,
+# so 0.1 std raises the total RMSE by less than 1%
+PRECISION_TOLERANCE = float(os.getenv('PRECISION_TOLERANCE', '0.1'))
+
+# Max int8 drift (RMSE in target std units) accepted for CPU quantization; same <1%
+# total RMSE budget as PRECISION_TOLERANCE
+QUANTIZATION_TOLERANCE = float(os.getenv('QUANTIZATION_TOLERANCE', '0.1'))
+
+# Per-process caches keyed by canonical SMILES
+CACHE_SIZE = int(os.getenv('PREDICTION_CACHE_SIZE', '10000'))
+prediction_cache = OrderedDict()
+molecule_info_cache = OrderedDict()
+
+# Reference molecules used to check mixed precision drift at startup
+VALIDATION_SMILES = [
+    'C', 'CCO', 'CC(=O)O', 'c1ccccc1', 'CC(=O)Oc1ccccc1C(=O)O',
+    'CN1C=NC2=C1C(=O)N(C(=O)N2C)C', 'OCC1OC(O)C(O)C(O)C1O', 'C#N'
+]
+
 PROPERTY_INFO = {
     'A': ('Rotational constant A', 'GHz'),
     'B': ('Rotational constant B', 'GHz'),
@@ -160,59 +316,121 @@ PROPERTY_INFO = {
     'g298_atom': ('Atomization free energy at 298K', 'eV')
 }
 
-def get_molecule_info(mol) -> MoleculeInfo:
-    """Extract basic molecule information"""
+def lru_get(cache: OrderedDict, key: str):
+    """Look up an entry in an OrderedDict cache, marking it recently used"""
+    value = cache.get(key)
+    if value is not None:
+        cache.move_to_end(key)
+    return value
+
+def lru_put(cache: OrderedDict, key: str, value):
+    """Store an entry in an OrderedDict cache, evicting the least recently used one when full"""
+    cache[key] = value
+    if len(cache) > CACHE_SIZE:
+        cache.popitem(last=False)
+
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def parse_smiles(smiles: str) -> tuple:
+    """Parse SMILES once into (canonical SMILES, packed fingerprint), cached by input string"""
     try:
-        return MoleculeInfo(
+        mol = Chem.MolFromSmiles(smiles)
+        if mol is None:
+            return None, None
+        
+        return Chem.MolToSmiles(mol), smiles_to_fingerprint(mol)
+    except Exception as e:
+        print(f"Error processing SMILES: {e}")
+        return None, None
+
+def smiles_to_fingerprint(mol) -> np.ndarray:
+    """Convert a parsed molecule to a bit-packed Morgan fingerprint"""
+    # 2048 bits packed into 256 bytes
+    arr = np.packbits(MORGAN_GENERATOR.GetFingerprintAsNumPy(mol))
+    arr.flags.writeable = False
+    return arr
+
+def get_molecule_info(canonical_smiles: str) -> Optional[MoleculeInfo]:
+    """Extract basic molecule information (cached by canonical SMILES)"""
+    mol_info = lru_get(molecule_info_cache, canonical_smiles)
+    if mol_info is not None:
+        return mol_info
+    
+    try:
+        # Only cache misses pay for re-parsing; Mol objects are never cached
+        mol = Chem.MolFromSmiles(canonical_smiles)
+        mol_info = MoleculeInfo(
             formula=Chem.rdMolDescriptors.CalcMolFormula(mol),
             molecular_weight=round(Descriptors.MolWt(mol), 2),
             num_atoms=mol.GetNumAtoms(),
             num_bonds=mol.GetNumBonds(),
             num_rings=Chem.rdMolDescriptors.CalcNumRings(mol),
-            aromatic=any(bond.GetIsAromatic() for bond in mol.GetBonds())
+            aromatic=len(mol.GetAromaticAtoms()) > 0
         )
     except Exception as e:
         return None
+    
+    lru_put(molecule_info_cache, canonical_smiles, mol_info)
+    return mol_info
 
-def smiles_to_fingerprint(smiles: str) -> tuple:
-    """Convert SMILES to Morgan fingerprint and molecule info"""
-    try:
-        mol = Chem.MolFromSmiles(smiles)
-        if mol is None:
-            return None, None
-        
-        fp = AllChem.GetMorganFingerprintAsBitVect(mol, 2, nBits=2048)
-        mol_info = get_molecule_info(mol)
-        
-        return np.array(fp), mol_info
-    except Exception as e:
-        print(f"Error processing SMILES: {e}")
-        return None, None
+def build_chat_context(target_properties: List[str]) -> str:
+    """Build the chatbot system prompt (everything before the conversation history)"""
+    context = """You are an expert AI chemistry assistant specializing in molecular properties and computational chemistry.
+
+Your capabilities:
+- Explain molecular structures, properties, and chemistry concepts
+- Interpret SMILES notation and molecular representations
+- Discuss quantum mechanical properties from the QM9 dataset
+- Help users understand molecular property predictions
+- Provide educational information about chemistry
+
+Available properties you can discuss:
+"""
+    for prop in target_properties:
+        info = PROPERTY_INFO.get(prop, (prop, 'N/A'))
+        context += f"- {prop}: {info[0]} ({info[1]})\n"
+    
+    context += """
+Guidelines:
+- Be clear, helpful, and scientifically accurate
+- Explain concepts at an appropriate level for the user
+- When discussing molecules, mention SMILES if relevant
+- Suggest using /predict endpoint for property predictions
+- Always note this is educational, not professional advice
+- Be friendly and encouraging
+
+"""
+    return context + "\n"
+
+def cache_prediction(canonical_smiles: str, predictions: np.ndarray):
+    """Store a prediction, evicting the least recently used entry when full"""
+    # Copy so the cache doesn't keep the whole padded batch output alive through a row view
+    predictions = predictions.copy()
+    predictions.flags.writeable = False
+    lru_put(prediction_cache, canonical_smiles, predictions)
+
+def build_confidence_bounds(target_properties: List[str]) -> tuple:
+    """Align the QM9 range checks with the model outputs as (lo, hi, has_bound) arrays"""
+    lo = np.full(len(target_properties), -np.inf, dtype=np.float32)
+    hi = np.full(len(target_properties), np.inf, dtype=np.float32)
+    has_bound = np.zeros(len(target_properties), dtype=bool)
+    
+    for i, prop_name in enumerate(target_properties):
+        if prop_name in CONFIDENCE_BOUNDS:
+            lo[i], hi[i] = CONFIDENCE_BOUNDS[prop_name]
+            has_bound[i] = True
+    
+    return lo, hi, has_bound
 
 def calculate_confidence(predictions: np.ndarray) -> str:
     """Calculate confidence based on prediction values"""
     try:
-        # Simple heuristic: check if values are in reasonable ranges
-        confidence_score = 0
-        total_checks = 0
+        # Simple heuristic: bounded properties must be within typical QM9 ranges,
+        # the rest only need to be finite
+        lo, hi, has_bound = confidence_bounds
+        in_bounds = (predictions >= lo) & (predictions <= hi)
+        ok = np.where(has_bound, in_bounds, np.isfinite(predictions))
         
-        for i, prop_name in enumerate(config['target_properties']):
-            value = predictions[i]
-            total_checks += 1
-            
-            # Check if values are within typical QM9 ranges
-            if prop_name == 'mu' and 0 <= value <= 10:
-                confidence_score += 1
-            elif prop_name == 'alpha' and 10 <= value <= 300:
-                confidence_score += 1
-            elif prop_name in ['homo', 'lumo'] and -15 <= value <= 5:
-                confidence_score += 1
-            elif prop_name == 'gap' and 0 <= value <= 20:
-                confidence_score += 1
-            elif not np.isnan(value) and not np.isinf(value):
-                confidence_score += 1
-        
-        confidence_ratio = confidence_score / total_checks if total_checks > 0 else 0
+        confidence_ratio = ok.mean() if ok.size > 0 else 0
         
         if confidence_ratio > 0.85:
             return "High"
@@ -223,13 +441,301 @@ def calculate_confidence(predictions: np.ndarray) -> str:
     except:
         return "Medium"
 
+def select_autocast_dtype() -> Optional[torch.dtype]:
+    """Pick the reduced precision dtype for GPU inference (INFERENCE_DTYPE=bf16|fp16|fp32)"""
+    if device.type != 'cuda':
+        return None
+    
+    choice = os.getenv('INFERENCE_DTYPE', 'fp16').lower()
+    return {'bf16': torch.bfloat16, 'fp16': torch.float16}.get(choice)
+
+def autocast_context():
+    """Autocast context for the forward pass (no-op when running in FP32)"""
+    if autocast_dtype is None:
+        return contextlib.nullcontext()
+    # Weight cast cache must be off for CUDA graph capture
+    return torch.autocast(device_type=device.type, dtype=autocast_dtype, cache_enabled=False)
+
+def validation_batch(smiles_list: List[str]) -> torch.Tensor:
+    """Stack fingerprints for a list of SMILES into a device tensor"""
+    fingerprints = [parse_smiles(s)[1] for s in smiles_list]
+    return torch.FloatTensor(np.unpackbits(np.stack(fingerprints), axis=1).astype(np.float32)).to(device)
+
+def install_fast_encoder(smiles_list: List[str]) -> bool:
+    """Swap the encoder for FastEncoderBlocks if outputs match on the given SMILES"""
+    fp_tensor = validation_batch(smiles_list)
+    encoder = model.transformer_encoder
+    
+    with torch.no_grad():
+        reference = model(fp_tensor)
+        model.transformer_encoder = nn.Sequential(
+            *[FastEncoderBlock.from_encoder_layer(layer) for layer in encoder.layers]
+        )
+        fast = model(fp_tensor)
+    
+    if torch.allclose(fast, reference, rtol=1e-4, atol=1e-4):
+        return True
+    
+    model.transformer_encoder = encoder
+    return False
+
+def scaled_rmse(output: torch.Tensor, reference: torch.Tensor) -> float:
+    """RMSE between two (unscaled) prediction batches in units of each target's training std"""
+    error = (output - reference) / torch.from_numpy(Y_scale).to(output.device)
+    return error.pow(2).mean().sqrt().item()
+
+def precision_drift(smiles_list: List[str]) -> float:
+    """Drift of the mixed precision outputs from FP32 (RMSE in target std units)"""
+    fp_tensor = validation_batch(smiles_list)
+    
+    with torch.no_grad():
+        reference = model(fp_tensor)
+        with autocast_context():
+            reduced = model(fp_tensor).float()
+    
+    return scaled_rmse(reduced, reference)
+
+def configure_cpu_threads():
+    """Use every core for intra-op parallelism and enable oneDNN kernels"""
+    torch.set_num_threads(os.cpu_count() or 1)
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        # Inter-op pool already started; keep its current size
+        pass
+    torch.backends.mkldnn.enabled = True
+
+def build_onnx_session(input_dim: int) -> bool:
+    """Export the model to ONNX and load it into ONNX Runtime if outputs match"""
+    global onnx_session
+    
+    buffer = io.BytesIO()
+    with torch.no_grad():
+        torch.onnx.export(
+            model, torch.zeros(1, input_dim), buffer,
+            opset_version=17,
+            input_names=["x"],
+            output_names=["y"],
+            dynamic_axes={"x": {0: "B"}, "y": {0: "B"}},
+            dynamo=False
+        )
+    
+    options = ort.SessionOptions()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    options.intra_op_num_threads = os.cpu_count() or 1
+    session = ort.InferenceSession(buffer.getvalue(), sess_options=options, providers=["CPUExecutionProvider"])
+    
+    fp_tensor = validation_batch(VALIDATION_SMILES)
+    with torch.no_grad():
+        reference = model(fp_tensor).numpy()
+    
+    if np.allclose(session.run(None, {"x": fp_tensor.numpy()})[0], reference, rtol=1e-4, atol=1e-4):
+        onnx_session = session
+        return True
+    return False
+
+def quantize_for_cpu(smiles_list: List[str]) -> tuple:
+    """Dynamically quantize Linear layers to int8 if the drift stays within tolerance.
+    
+    Drift is the RMSE against the FP32 model in units of each target's training
+    std. The fused FP32Linear layers are left in float (quantize_dynamic matches
+    exact module types).
+    """
+    global model
+    
+    fp_tensor = validation_batch(smiles_list)
+    quantized = torch.ao.quantization.quantize_dynamic(model, {nn.Linear}, dtype=torch.qint8)
+    
+    with torch.no_grad():
+        drift = scaled_rmse(quantized(fp_tensor), model(fp_tensor))
+    
+    accepted = drift <= QUANTIZATION_TOLERANCE
+    if accepted:
+        model = quantized
+    return accepted, drift
+
+def optimize_for_cpu(input_dim: int) -> bool:
+    """Trace and freeze the model with TorchScript if it matches eager outputs"""
+    global model
+    
+    example = torch.zeros(1, input_dim)
+    fp_tensor = validation_batch(VALIDATION_SMILES)
+    
+    with torch.no_grad():
+        traced = torch.jit.optimize_for_inference(torch.jit.trace(eager_model, example))
+        # Warm-up runs let the profiling executor specialise before the first request
+        for _ in range(3):
+            traced(example)
+        matches = torch.allclose(traced(fp_tensor), eager_model(fp_tensor), rtol=1e-4, atol=1e-4)
+    
+    if matches:
+        model = traced
+    return matches
+
+def capture_cuda_graphs(input_dim: int):
+    """Capture the eager model's forward pass into one replayable CUDA graph per batch bucket"""
+    global cuda_graphs
+    
+    graphs = {}
+    pool = torch.cuda.graph_pool_handle()
+    
+    with torch.no_grad(), autocast_context():
+        for size in BATCH_BUCKETS:
+            static_input = torch.zeros(size, input_dim, device=device)
+            
+            # Warm up on a side stream before capture
+            stream = torch.cuda.Stream()
+            stream.wait_stream(torch.cuda.current_stream())
+            with torch.cuda.stream(stream):
+                for _ in range(3):
+                    eager_model(static_input)
+            torch.cuda.current_stream().wait_stream(stream)
+            
+            graph = torch.cuda.CUDAGraph()
+            with torch.cuda.graph(graph, pool=pool):
+                static_output = eager_model(static_input)
+            graphs[size] = (graph, static_input, static_output)
+    
+    cuda_graphs = graphs
+
+def warm_up_compiled(compiled, input_dim: int):
+    """Compile (and record CUDA graphs for) every batch bucket before serving"""
+    with torch.inference_mode(), autocast_context():
+        for size in BATCH_BUCKETS:
+            for _ in range(3):
+                compiled(torch.zeros(size, input_dim, device=device))
+
+def run_model(fp_tensor: torch.Tensor) -> np.ndarray:
+    """Run a forward pass and copy the (already unscaled) predictions to the host.
+    
+    Uses the ONNX Runtime session on CPU, or replays the CUDA graph captured
+    for this batch size. Inverse scaling is fused into the output layer, so the only
+    device work after the forward is a single float32 device-to-host copy.
+    """
+    if onnx_session is not None:
+        return onnx_session.run(None, {"x": fp_tensor.numpy()})[0]
+    captured = cuda_graphs.get(fp_tensor.shape[0])
+    if captured is not None:
+        graph, static_input, static_output = captured
+        static_input.copy_(fp_tensor, non_blocking=True)
+        graph.replay()
+        output = static_output
+    else:
+        with autocast_context():
+            output = model(fp_tensor)
+    return output.to('cpu', torch.float32).numpy()
+
+def to_device(fingerprints: List[np.ndarray]) -> torch.Tensor:
+    """Unpack bit-packed fingerprints and move them to the device as a float32 batch.
+    
+    On CUDA the packed bytes go through the pinned buffer and are unpacked and
+    cast on the device, so only 256 bytes per molecule cross the bus.
+    """
+    if host_buffer is None:
+        return torch.from_numpy(np.unpackbits(np.stack(fingerprints), axis=1).astype(np.float32)).to(device)
+    
+    # Only the inference thread uses the buffers, and it syncs on the output copy before reusing them
+    n = len(fingerprints)
+    np.stack(fingerprints, out=host_buffer[:n].numpy())
+    device_bits[:n].copy_(host_buffer[:n], non_blocking=True)
+    bits = device_bits[:n].unsqueeze(-1).bitwise_right_shift(bit_shifts).bitwise_and_(1)
+    device_buffer[:n].copy_(bits.view(n, -1))
+    return device_buffer[:n]
+
+def run_sparse(fingerprints: List[np.ndarray]) -> np.ndarray:
+    """Run the eager model with input_projection computed as a gather-and-sum.
+    
+    Fingerprints are {0, 1}, so W @ x is the sum of the weight columns for the
+    set bits (typically a few dozen of 2048).
+    """
+    rows, cols = np.nonzero(np.unpackbits(np.stack(fingerprints), axis=1))
+    offsets = np.searchsorted(rows, np.arange(len(fingerprints)))
+    
+    x = nn.functional.embedding_bag(
+        torch.from_numpy(cols), projection_weight_t, torch.from_numpy(offsets), mode='sum'
+    ) + eager_model.input_projection.bias
+    return eager_model.encode(x).numpy()
+
+def enable_sparse_input(smiles_list: List[str]) -> bool:
+    """Switch CPU inference to run_sparse if it matches the dense model"""
+    global projection_weight_t, sparse_input
+    
+    projection_weight_t = eager_model.input_projection.weight.detach().t().contiguous()
+    fingerprints = [parse_smiles(s)[1] for s in smiles_list]
+    
+    with torch.no_grad():
+        reference = eager_model(validation_batch(smiles_list)).numpy()
+        sparse_input = np.allclose(run_sparse(fingerprints), reference, rtol=1e-4, atol=1e-4)
+    
+    if not sparse_input:
+        projection_weight_t = None
+    return sparse_input
+
+def infer_batch(fingerprints: List[np.ndarray]) -> np.ndarray:
+    """Forward pass for one batch; only ever runs on the inference thread"""
+    with torch.inference_mode():
+        if sparse_input:
+            return run_sparse(fingerprints)
+        
+        # Pad to a warmed-up bucket so compiled/graph paths never see a new shape
+        n = len(fingerprints)
+        if pad_batches:
+            bucket = next(size for size in BATCH_BUCKETS if size >= n)
+            fingerprints = fingerprints + [np.zeros_like(fingerprints[0])] * (bucket - n)
+        return run_model(to_device(fingerprints))[:n]
+
+async def batch_loop():
+    """Coalesce queued prediction requests into batched forward passes.
+    
+    The forward pass runs on the single inference thread, so the event loop
+    stays free to accept and serialize requests while the model is busy.
+    """
+    loop = asyncio.get_running_loop()
+    
+    while True:
+        batch = [await request_queue.get()]
+        deadline = loop.time() + MAX_BATCH_DELAY
+        
+        while len(batch) < MAX_BATCH_SIZE:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(request_queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        
+        try:
+            fingerprints = [fp for fp, _ in batch]
+            preds = await loop.run_in_executor(inference_executor, infer_batch, fingerprints)
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            continue
+        
+        for (_, future), pred in zip(batch, preds):
+            if not future.done():
+                future.set_result(pred)
+
+async def predict_batched(fingerprint: np.ndarray) -> np.ndarray:
+    """Queue a 1-D packed fingerprint for the batcher and wait for its prediction"""
+    future = asyncio.get_running_loop().create_future()
+    await request_queue.put((fingerprint, future))
+    return await future
+
 # -----------------------------
 # Startup Event
 # -----------------------------
 @app.on_event("startup")
 async def load_model():
     """Load model, scalers, and configure Gemini"""
-    global model, scaler_X, scaler_y, config, device, gemini_model
+    global model, eager_model, onnx_session, cuda_graphs, pad_batches
+    global X_mean, X_scale, Y_mean, Y_scale, config, confidence_bounds, property_labels
+    global chat_context_prefix
+    global device, autocast_dtype, gemini_model
+    global request_queue, batch_task, inference_executor, sparse_input
+    global host_buffer, device_bits, device_buffer, bit_shifts
     
     try:
         print("\n" + "="*70)
@@ -239,7 +745,33 @@ async def load_model():
         device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
         print(f"\n✓ Using device: {device}")
         
-        # Load checkpoint first to get dimensions
+        if device.type == 'cpu':
+            configure_cpu_threads()
+            print(f"✓ CPU threads: {torch.get_num_threads()} intra-op / {torch.get_num_interop_threads()} inter-op")
+        
+        autocast_dtype = select_autocast_dtype()
+        
+        # Load config
+        config_path = './working/config.pkl'
+        with open(config_path, 'rb') as f:
+            config = pickle.load(f)
+        print(f"✓ Config loaded: {len(config['target_properties'])} properties")
+        
+        confidence_bounds = build_confidence_bounds(config['target_properties'])
+        property_labels = [PROPERTY_INFO.get(prop, (prop, 'N/A')) for prop in config['target_properties']]
+        chat_context_prefix = build_chat_context(config['target_properties'])
+        
+        # Load scalers
+        scaler_x_path = './working/scaler_X.pkl'
+        scaler_y_path = './working/scaler_y.pkl'
+        
+        with open(scaler_x_path, 'rb') as f:
+            X_mean, X_scale = scaler_vectors(pickle.load(f))
+        with open(scaler_y_path, 'rb') as f:
+            Y_mean, Y_scale = scaler_vectors(pickle.load(f))
+        print(f"✓ Scalers loaded successfully!")
+        
+        # Load checkpoint to get dimensions
         checkpoint_path = "./working/best_transformer_model.pth"
 
         print(f"\n✓ Loading model from: {checkpoint_path}")
@@ -266,21 +798,105 @@ async def load_model():
         model.eval()
         print(f"✓ Model loaded successfully!")
         
-        # Load config
-        config_path = './working/config.pkl'
-        with open(config_path, 'rb') as f:
-            config = pickle.load(f)
-        print(f"✓ Config loaded: {len(config['target_properties'])} properties")
+        # Fold the scalers into the first and last Linear layers
+        fuse_scalers(model)
+        print(f"✓ Scalers fused into the model!")
         
-        # Load scalers
-        scaler_x_path = './working/scaler_X.pkl'
-        scaler_y_path = './working/scaler_y.pkl'
+        # Replace nn.TransformerEncoder with the seq_len=1 specialised blocks
+        fast_encoder = False
+        if os.getenv('FAST_ENCODER', '1') == '1':
+            fast_encoder = install_fast_encoder(VALIDATION_SMILES)
+            if fast_encoder:
+                print(f"✓ Fast encoder blocks installed!")
+            else:
+                print(f"⚠️  Fast encoder outputs differ from checkpoint - keeping nn.TransformerEncoder")
         
-        with open(scaler_x_path, 'rb') as f:
-            scaler_X = pickle.load(f)
-        with open(scaler_y_path, 'rb') as f:
-            scaler_y = pickle.load(f)
-        print(f"✓ Scalers loaded successfully!")
+        # Keep mixed precision only if it stays within tolerance of FP32
+        if autocast_dtype is not None:
+            drift = precision_drift(VALIDATION_SMILES)
+            if drift <= PRECISION_TOLERANCE:
+                print(f"✓ Mixed precision inference: {autocast_dtype} (drift {drift:.4f} std)")
+            else:
+                print(f"⚠️  {autocast_dtype} drift {drift:.4f} std exceeds tolerance - using FP32")
+                autocast_dtype = None
+        
+        # Serve CPU inference through ONNX Runtime when it is installed
+        if device.type == 'cpu' and ort is not None and os.getenv('ONNX_RUNTIME', '1') == '1':
+            try:
+                if build_onnx_session(input_dim):
+                    print(f"✓ ONNX Runtime session ready for CPU inference!")
+                else:
+                    print(f"⚠️  ONNX Runtime outputs differ from eager - using PyTorch")
+            except Exception as e:
+                print(f"⚠️  ONNX export failed ({e}) - using PyTorch")
+        
+        # Quantize Linear layers to int8 for CPU inference (opt-in: this checkpoint drifts
+        # ~0.19 std). Only the fast encoder is quantized, since quantized Linears break
+        # nn.TransformerEncoder's fast path
+        if device.type == 'cpu' and onnx_session is None and fast_encoder and os.getenv('QUANTIZE_INT8', '0') == '1':
+            try:
+                accepted, drift = quantize_for_cpu(VALIDATION_SMILES)
+                if accepted:
+                    print(f"✓ Model quantized to int8 (drift {drift:.4f} std)")
+                else:
+                    print(f"⚠️  int8 drift {drift:.4f} std exceeds tolerance - keeping FP32 model")
+            except Exception as e:
+                print(f"⚠️  int8 quantization failed ({e}) - keeping FP32 model")
+        
+        # Dedicated inference thread; compile warm-up and graph capture run on it too,
+        # since reduce-overhead and CUDA graph state is per thread
+        inference_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="inference")
+        
+        # Compile the model (input shape is fixed, so compile once and warm up here)
+        eager_model = model
+        if device.type == 'cpu' and onnx_session is None and os.getenv('TORCH_JIT', '1') == '1':
+            try:
+                if inference_executor.submit(optimize_for_cpu, input_dim).result():
+                    print(f"✓ Model optimized with TorchScript for CPU!")
+                else:
+                    print(f"⚠️  TorchScript outputs differ from eager - using eager model")
+            except Exception as e:
+                print(f"⚠️  TorchScript optimization failed ({e}) - using eager model")
+        elif onnx_session is None and os.getenv('TORCH_COMPILE', '1') == '1':
+            try:
+                compiled = torch.compile(model, mode="reduce-overhead", fullgraph=True, dynamic=False)
+                inference_executor.submit(warm_up_compiled, compiled, input_dim).result()
+                model = compiled
+                pad_batches = True
+                print(f"✓ Model compiled with torch.compile for batch sizes {BATCH_BUCKETS}!")
+            except Exception as e:
+                print(f"⚠️  torch.compile failed ({e}) - using eager model")
+        
+        # Gather-and-sum input projection when the CPU model runs eagerly
+        if device.type == 'cpu' and onnx_session is None and model is eager_model and os.getenv('SPARSE_INPUT', '1') == '1':
+            if enable_sparse_input(VALIDATION_SMILES):
+                print(f"✓ Sparse input projection enabled!")
+            else:
+                print(f"⚠️  Sparse input projection differs from dense - using dense input")
+        
+        # Capture CUDA graphs for each (bucket, input_dim) forward pass, unless
+        # torch.compile's reduce-overhead mode is already replaying its own
+        if device.type == 'cuda' and model is eager_model and os.getenv('CUDA_GRAPHS', '1') == '1':
+            try:
+                inference_executor.submit(capture_cuda_graphs, input_dim).result()
+                pad_batches = True
+                print(f"✓ CUDA graphs captured for batch sizes {BATCH_BUCKETS}!")
+            except Exception as e:
+                cuda_graphs = {}
+                print(f"⚠️  CUDA graph capture failed ({e}) - using eager inference")
+        
+        # Pinned staging buffers for async host-to-device copies
+        if device.type == 'cuda':
+            host_buffer = torch.empty(MAX_BATCH_SIZE, input_dim // 8, dtype=torch.uint8, pin_memory=True)
+            device_bits = torch.empty(MAX_BATCH_SIZE, input_dim // 8, dtype=torch.uint8, device=device)
+            # np.packbits order: most significant bit first
+            bit_shifts = torch.arange(7, -1, -1, dtype=torch.uint8, device=device)
+            device_buffer = torch.empty(MAX_BATCH_SIZE, input_dim, device=device)
+        
+        # Start the dynamic batcher
+        request_queue = asyncio.Queue()
+        batch_task = asyncio.create_task(batch_loop())
+        print(f"✓ Dynamic batching: up to {MAX_BATCH_SIZE} requests / {MAX_BATCH_DELAY * 1000:.0f} ms")
         
         # Configure Gemini
         api_key = os.getenv('GEMINI_API_KEY')
@@ -304,9 +920,28 @@ async def load_model():
         print(f"\n❌ ERROR during startup: {e}")
         raise
 
+@app.on_event("shutdown")
+async def stop_batcher():
+    """Stop the dynamic batcher and the inference thread"""
+    if batch_task is not None:
+        batch_task.cancel()
+    if inference_executor is not None:
+        inference_executor.shutdown(wait=False)
+
 # -----------------------------
 # API Endpoints
 # -----------------------------
+def prediction_error(smiles: str, error: str) -> ORJSONResponse:
+    """Failed /predict response with the PredictionResponse defaults"""
+    return ORJSONResponse({
+        "success": False,
+        "smiles": smiles,
+        "molecule_info": None,
+        "predictions": [],
+        "model_confidence": "Medium",
+        "error": error
+    })
+
 @app.get("/")
 async def root():
     """Root endpoint"""
@@ -354,75 +989,58 @@ async def list_properties():
         "properties": properties
     }
 
-@app.post("/predict", response_model=PredictionResponse)
+@app.post("/predict", response_model=PredictionResponse, response_class=ORJSONResponse)
 async def predict(input_data: MoleculeInput):
     """Predict molecular properties from SMILES"""
     if model is None:
-        return PredictionResponse(
-            success=False,
-            smiles=input_data.smiles,
-            error="Model not loaded"
-        )
+        return prediction_error(input_data.smiles, "Model not loaded")
     
     try:
-        # Convert SMILES to fingerprint
-        fingerprint, mol_info = smiles_to_fingerprint(input_data.smiles)
+        # Parse SMILES once into canonical form and fingerprint (cached by input string)
+        canonical, fingerprint = parse_smiles(input_data.smiles)
         
         if fingerprint is None:
-            return PredictionResponse(
-                success=False,
-                smiles=input_data.smiles,
-                error="Invalid SMILES string. Please check the molecule structure."
+            return prediction_error(
+                input_data.smiles,
+                "Invalid SMILES string. Please check the molecule structure."
             )
         
-        # Scale input
-        fp_scaled = scaler_X.transform(fingerprint.reshape(1, -1))
+        # Predict (scalers are fused into the model, batched with concurrent requests)
+        predictions = lru_get(prediction_cache, canonical)
+        if predictions is None:
+            predictions = await predict_batched(fingerprint)
+            cache_prediction(canonical, predictions)
         
-        # Predict
-        with torch.no_grad():
-            model.eval()
-            fp_tensor = torch.FloatTensor(fp_scaled).to(device)
-            pred_scaled = model(fp_tensor).cpu().numpy()
-        
-        # Inverse transform
-        predictions = scaler_y.inverse_transform(pred_scaled)[0]
+        # Molecule info is optional (cached by canonical SMILES)
+        mol_info = get_molecule_info(canonical) if input_data.include_info else None
         
         # Calculate confidence
         confidence = calculate_confidence(predictions)
         
-        # Format predictions
-        pred_list = []
-        for i, prop_name in enumerate(config['target_properties']):
-            info = PROPERTY_INFO.get(prop_name, (prop_name, 'N/A'))
-            
-            # Determine individual property confidence
-            value = predictions[i]
-            if np.isnan(value) or np.isinf(value):
-                prop_confidence = "Low"
-            else:
-                prop_confidence = confidence
-            
-            pred_list.append(PropertyPrediction(
-                property_name=info[0],
-                value=round(float(value), 6),
-                unit=info[1],
-                confidence=prop_confidence
-            ))
-        
-        return PredictionResponse(
-            success=True,
-            smiles=input_data.smiles,
-            molecule_info=mol_info,
-            predictions=pred_list,
-            model_confidence=confidence
-        )
+        # Format predictions (non-finite values get Low confidence)
+        values = np.round(predictions.astype(np.float64), 6).tolist()
+        finite = np.isfinite(predictions).tolist()
+        pred_list = [
+            {
+                "property_name": name,
+                "value": value,
+                "unit": unit,
+                "confidence": confidence if is_finite else "Low"
+            }
+            for (name, unit), value, is_finite in zip(property_labels, values, finite)
+        ]
+        
+        return ORJSONResponse({
+            "success": True,
+            "smiles": input_data.smiles,
+            "molecule_info": mol_info.model_dump() if mol_info else None,
+            "predictions": pred_list,
+            "model_confidence": confidence,
+            "error": None
+        })
         
     except Exception as e:
-        return PredictionResponse(
-            success=False,
-            smiles=input_data.smiles,
-            error=f"Prediction error: {str(e)}"
-        )
+        return prediction_error(input_data.smiles, f"Prediction error: {str(e)}")
 
 @app.post("/chat", response_model=ChatResponse)
 async def chat(input_data: ChatInput):
@@ -435,44 +1053,15 @@ async def chat(input_data: ChatInput):
         )
     
     try:
-        # Build context
-        context = """You are an expert AI chemistry assistant specializing in molecular properties and computational chemistry.
-
-Your capabilities:
-- Explain molecular structures, properties, and chemistry concepts
-- Interpret SMILES notation and molecular representations
-- Discuss quantum mechanical properties from the QM9 dataset
-- Help users understand molecular property predictions
-- Provide educational information about chemistry
-
-Available properties you can discuss:
-"""
-        for prop in config['target_properties']:
-            info = PROPERTY_INFO.get(prop, (prop, 'N/A'))
-            context += f"- {prop}: {info[0]} ({info[1]})\n"
-        
-        context += """
-Guidelines:
-- Be clear, helpful, and scientifically accurate
-- Explain concepts at an appropriate level for the user
-- When discussing molecules, mention SMILES if relevant
-- Suggest using /predict endpoint for property predictions
-- Always note this is educational, not professional advice
-- Be friendly and encouraging
-
-"""
-        
-        # Build conversation
-        conversation = context + "\n"
-        for msg in input_data.history[-10:]:
-            role = msg.get('role', 'user')
-            content = msg.get('content', '')
-            conversation += f"{role.capitalize()}: {content}\n"
-        
-        conversation += f"User: {input_data.message}\nAssistant:"
+        # Build conversation on top of the precomputed context
+        history = "".join(
+            f"{msg.get('role', 'user').capitalize()}: {msg.get('content', '')}\n"
+            for msg in input_data.history[-10:]
+        )
+        conversation = f"{chat_context_prefix}{history}User: {input_data.message}\nAssistant:"
         
-        # Generate response
-        response = gemini_model.generate_content(conversation)
+        # Generate response off the event loop
+        response = await asyncio.to_thread(gemini_model.generate_content, conversation)
         
         return ChatResponse(
             success=True,